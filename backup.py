@@ -1,55 +1,495 @@
+import errno
 import os
 import shutil
 import time
+from array import array
 
-def perform_backup(src, dst, logger, dry_run=False, update_progress=None):
-    """ 
+from tracing import null_span
+
+# Retry policy for a single file: attempts and the first backoff delay in seconds.
+# The delay doubles after every failed attempt (0.5s, 1s, 2s, ...).
+RETRY_ATTEMPTS = 4
+RETRY_BASE_DELAY = 0.5
+
+# errno values that usually clear up on their own (busy files, flaky network shares)
+TRANSIENT_ERRNOS = {
+    errno.EAGAIN, errno.EBUSY, errno.EINTR, errno.EIO, errno.ETIMEDOUT,
+    errno.ECONNRESET, errno.ECONNABORTED, errno.ENETRESET, errno.ENETUNREACH, errno.EHOSTUNREACH,
+}
+# Windows: sharing violation, lock violation, network name no longer available, unexpected network error
+TRANSIENT_WINERRORS = {32, 33, 59, 64}
+
+# Seconds to wait after a run with failed files before the retry pass over just those files
+RETRY_PASS_DELAY = 60
+
+# Seconds every file costs besides the copy itself: the short sleep between files and the progress update
+FILE_OVERHEAD = 0.002
+
+# A file is copied to ".<name>.partial" next to its destination and renamed when complete
+PARTIAL_SUFFIX = ".partial"
+
+
+class InsufficientSpaceError(Exception):
+    """Raised when a backup plan needs more space than the destination has free."""
+    pass
+
+
+class FileTable:
+    """
+    Compact list of files for one run, kept small enough for trees with millions of entries.
+    Directories are stored as (parent, name) rows, so each one only keeps its own name
+    and files refer to their directory by index. File names are packed into a single
+    bytes buffer and sizes live in an array, so a file costs a few dozen bytes instead of
+    a tuple of full path strings.
+    """
+    __slots__ = ("_dir_parents", "_dir_names", "_dir_index", "_dir_col", "_size_col", "_names", "_name_ends")
+
+    def __init__(self):
+        self._dir_parents = array("i")  # Parent row of every directory, -1 for the job root
+        self._dir_names = []  # Last path component of every directory, "" for the job root
+        self._dir_index = {}  # (parent row, name): row
+        self._dir_col = array("I")  # Directory row of every file
+        self._size_col = array("q")  # Size of every file
+        self._names = bytearray()  # All file names back to back
+        self._name_ends = array("Q")  # End offset of every name in _names
+
+    def _child_dir(self, parent, name):
+        key = (parent, name)
+        index = self._dir_index.get(key)
+        if index is None:
+            index = len(self._dir_names)
+            self._dir_parents.append(parent)
+            self._dir_names.append(name)
+            self._dir_index[key] = index
+        return index
+
+    def add_dir(self, rel_dir):
+        """Register a directory relative to the job root ("" is the root) and return its row."""
+        index = self._child_dir(-1, "")
+        for name in rel_dir.split(os.sep) if rel_dir else ():
+            index = self._child_dir(index, name)
+        return index
+
+    def dir_path(self, index):
+        """Rebuild the relative path of a directory row."""
+        parts = []
+        while index > 0:
+            parts.append(self._dir_names[index])
+            index = self._dir_parents[index]
+        return os.path.join(*reversed(parts)) if parts else ""
+
+    @property
+    def dir_count(self):
+        return len(self._dir_names)
+
+    @property
+    def dirs(self):
+        """Relative paths of all directories, parents before children."""
+        return [self.dir_path(i) for i in range(len(self._dir_names))]
+
+    def add(self, dir_index, name, size):
+        self._dir_col.append(dir_index)
+        self._size_col.append(size)
+        self._names += os.fsencode(name)
+        self._name_ends.append(len(self._names))
+
+    def __len__(self):
+        return len(self._size_col)
+
+    def __iter__(self):
+        """Yield (relative directory, file name, size) for every file."""
+        start = 0
+        last_index, last_path = -1, ""
+        for i, end in enumerate(self._name_ends):
+            dir_index = self._dir_col[i]
+            if dir_index != last_index:
+                # Files of one directory are added together, so this rarely rebuilds
+                last_index, last_path = dir_index, self.dir_path(dir_index)
+            yield last_path, os.fsdecode(bytes(self._names[start:end])), self._size_col[i]
+            start = end
+
+    def paths(self, src, dst):
+        """Yield (src_file, dst_file, size) with full paths under src and dst."""
+        for rel_dir, name, size in self:
+            yield os.path.join(src, rel_dir, name), os.path.join(dst, rel_dir, name), size
+
+
+class BackupPlan:
+    """
+    Result of a planning pass over src and dst.
+    Holds the files that would be copied, what they cost and an ETA,
+    so perform_backup can run it without walking the tree again.
+    """
+
+    def __init__(self, src, dst):
+        self.src = src
+        self.dst = dst
+        self.copies = FileTable()  # Files that need copying, plus folders missing at destination
+        self.total_files = 0  # Files scanned in source
+        self.copy_bytes = 0  # Bytes that will be written
+        self.overwrite_bytes = 0  # Bytes of destination files that get replaced
+        self.delete_files = 0  # Files at destination that no longer exist in source
+        self.delete_bytes = 0
+        self.free_bytes = None  # Free space on the destination drive
+        self.throughput = None  # Bytes per second measured on past runs
+        self.plan_seconds = 0.0
+        self.copied_bytes = 0  # Bytes actually written by perform_backup
+        self.copy_seconds = 0.0  # Time spent copying them, without pauses, throttling or sleeps
+        self.run_seconds = 0.0  # Wall time of the whole copy loop, including whatever update_progress waits for
+        self.errors = []  # (src_file, dst_file, size, message) for every file that could not be backed up, size None for folders
+
+    @property
+    def copy_files(self):
+        return len(self.copies)
+
+    @property
+    def folders(self):
+        # Destination folders that have to exist before copying
+        return [os.path.join(self.dst, rel_dir) for rel_dir in self.copies.dirs]
+
+    def copy_paths(self):
+        return self.copies.paths(self.src, self.dst)
+
+    @property
+    def needed_bytes(self):
+        # Overwritten files give their space back, so only the growth counts
+        return max(self.copy_bytes - self.overwrite_bytes, 0)
+
+    @property
+    def fits(self):
+        if self.free_bytes is None:
+            return True
+        return self.needed_bytes <= self.free_bytes
+
+    @property
+    def eta_seconds(self):
+        if not self.throughput:
+            return None
+        return self.copy_bytes / self.throughput + self.copy_files * FILE_OVERHEAD
+
+    def retry_plan(self):
+        """Return a new plan that only contains the files that failed in this one."""
+        plan = BackupPlan(self.src, self.dst)
+        plan.throughput = self.throughput
+        for src_file, dst_file, size, _ in self.errors:
+            if size is None:
+                # A folder that could not be read during planning: plan its subtree now,
+                # unless it has been removed since
+                if os.path.isdir(src_file):
+                    _merge_plan(plan, plan_backup(src_file, dst_file), os.path.relpath(dst_file, self.dst))
+                continue
+            rel_dir = os.path.relpath(os.path.dirname(dst_file), self.dst)
+            rel_dir = "" if rel_dir == os.curdir else rel_dir
+            plan.copies.add(plan.copies.add_dir(rel_dir), os.path.basename(dst_file), size)
+            plan.copy_bytes += size
+        plan.total_files = len(plan.copies)
+        plan.free_bytes = _free_space(self.dst)
+        return plan
+
+    def error_report(self):
+        if not self.errors:
+            return "No errors."
+        lines = [f"{len(self.errors)} file(s) or folder(s) could not be backed up:"]
+        for src_file, _, _, message in self.errors:
+            lines.append(f"  {src_file}: {message}")
+        return "\n".join(lines)
+
+    def summary(self):
+        lines = [
+            f"Files to copy: {self.copy_files} of {self.total_files} ({format_bytes(self.copy_bytes)})",
+            f"Files only in destination: {self.delete_files} ({format_bytes(self.delete_bytes)})",
+        ]
+        if self.free_bytes is not None:
+            lines.append(f"Space needed: {format_bytes(self.needed_bytes)}, free: {format_bytes(self.free_bytes)}")
+        eta = self.eta_seconds
+        if eta is not None:
+            lines.append(f"Estimated time: {format_duration(eta)}")
+        else:
+            lines.append("Estimated time: unknown (no previous runs)")
+        if not self.fits:
+            lines.append("Not enough free space on destination.")
+        return "\n".join(lines)
+
+
+def _merge_plan(plan, sub, prefix):
+    # Add the files of sub, planned for a folder below plan.src, to plan
+    prefix = "" if prefix == os.curdir else prefix
+    for rel_dir in sub.copies.dirs:
+        plan.copies.add_dir(os.path.join(prefix, rel_dir) if rel_dir else prefix)  # Keeps empty folders
+    for rel_dir, name, size in sub.copies:
+        plan.copies.add(plan.copies.add_dir(os.path.join(prefix, rel_dir) if rel_dir else prefix), name, size)
+        plan.copy_bytes += size
+    plan.overwrite_bytes += sub.overwrite_bytes
+    plan.errors.extend(sub.errors)
+
+
+def format_bytes(num):
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if num < 1024 or unit == "TB":
+            return f"{num:.0f} {unit}" if unit == "B" else f"{num:.1f} {unit}"
+        num /= 1024
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}h {minutes}m"
+    if minutes:
+        return f"{minutes}m {secs}s"
+    return f"{secs}s"
+
+
+def _free_space(path):
+    # The destination might not exist yet, so look at the closest existing parent
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+    try:
+        return shutil.disk_usage(path).free
+    except OSError:
+        return None
+
+
+def is_transient_error(exc):
+    """Return True if exc is an OS error that might succeed when tried again."""
+    if getattr(exc, "winerror", None) in TRANSIENT_WINERRORS:
+        return True
+    return isinstance(exc, OSError) and exc.errno in TRANSIENT_ERRNOS
+
+
+def copy_with_retry(src_file, dst_file, logger, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY):
+    """
+    Copy one file, retrying transient errors with exponential backoff.
+    The copy is written to a temporary name next to dst_file and only renamed into
+    place once it is complete, so a failed copy never leaves a truncated file that
+    looks newer than the source.
+    Returns the seconds the successful attempt took, without the backoff.
+    Raises the last error if the file still cannot be copied.
+    """
+    folder, name = os.path.split(dst_file)
+    tmp_file = os.path.join(folder, f".{name}{PARTIAL_SUFFIX}")
+    for attempt in range(attempts):
+        try:
+            start = time.perf_counter()
+            try:
+                shutil.copy2(src_file, tmp_file) # copy2 preserves metadata
+                os.replace(tmp_file, dst_file)
+            except BaseException:
+                try:
+                    os.remove(tmp_file)
+                except OSError:
+                    pass
+                raise
+            return time.perf_counter() - start
+        except OSError as e:
+            if attempt == attempts - 1 or not is_transient_error(e):
+                raise
+            delay = base_delay * (2 ** attempt)
+            logger(f"Retrying in {delay:.1f}s: {src_file} ({e})")
+            time.sleep(delay)
+
+
+def _scan_tree(src, on_error):
+    """
+    Yield (relative directory, iterator of os.DirEntry) for every directory under src.
+    Uses os.scandir with a stack of pending directories, so no per-directory name
+    lists are built. Symlinked directories are not followed, same as os.walk.
+    on_error(rel_dir, exc) is called for every directory that cannot be read.
+    """
+    pending = [""]
+    while pending:
+        rel_dir = pending.pop()
+        try:
+            it = os.scandir(os.path.join(src, rel_dir))
+        except OSError as e:
+            on_error(rel_dir, e)
+            continue
+        with it:
+            yield rel_dir, _files_and_push_dirs(it, rel_dir, pending, on_error)
+
+
+def _files_and_push_dirs(it, rel_dir, pending, on_error):
+    while True:
+        try:
+            entry = next(it)
+        except StopIteration:
+            return
+        except OSError as e:
+            # Listing broke off half way, e.g. a network share went away
+            on_error(rel_dir, e)
+            return
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            if not entry.is_symlink():
+                pending.append(os.path.join(rel_dir, entry.name))
+        else:
+            yield entry
+
+
+def plan_backup(src, dst, throughput=None, tracer=None):
+    """
+    Walk src and dst once and work out what a backup would do.
+    Only stats files, nothing is copied or created.
+    throughput is the bytes/second measured on earlier runs, used for the ETA.
+    tracer (tracing.Tracer) collects timings when the run is traced.
+    """
+    start = time.perf_counter()
+    span = tracer.span if tracer is not None else null_span
+    plan = BackupPlan(src, dst)
+    plan.throughput = throughput
+    table = plan.copies
+
+    def folder_error(rel_dir, e):
+        # Everything below this folder is skipped; the retry pass plans it again
+        plan.errors.append((os.path.join(src, rel_dir), os.path.join(dst, rel_dir), None, f"Folder could not be read: {e}"))
+
+    for rel_dir, entries in _scan_tree(src, folder_error):
+        target_folder = os.path.join(dst, rel_dir)
+        dir_index = None
+
+        # One listing of the destination folder instead of an exists() call per file
+        dst_entries = {}  # name: (size, mtime)
+        try:
+            with span("list_destination", folder=rel_dir), os.scandir(target_folder) as it:
+                for entry in it:
+                    if entry.is_file():
+                        st = entry.stat()
+                        dst_entries[entry.name] = (st.st_size, st.st_mtime)
+        except FileNotFoundError:
+            dir_index = table.add_dir(rel_dir)  # Has to be created even if it stays empty
+        except OSError:
+            pass
+
+        for entry in entries:
+            try:
+                if tracer is None:
+                    src_stat = entry.stat()
+                else:
+                    stat_start = time.perf_counter()
+                    src_stat = entry.stat()
+                    tracer.add_time("stat", time.perf_counter() - stat_start)
+            except OSError as e:
+                dst_entries.pop(entry.name, None)
+                plan.errors.append((entry.path, os.path.join(target_folder, entry.name), 0, str(e)))
+                continue
+            plan.total_files += 1
+            dst_info = dst_entries.pop(entry.name, None)
+            # Same rule as the copy: missing at destination or newer in source
+            if dst_info is None or src_stat.st_mtime > dst_info[1]:
+                if dir_index is None:
+                    dir_index = table.add_dir(rel_dir)
+                table.add(dir_index, entry.name, src_stat.st_size)
+                plan.copy_bytes += src_stat.st_size
+                if dst_info is not None:
+                    plan.overwrite_bytes += dst_info[0]
+
+        # Whatever is left exists only at the destination
+        for size, _ in dst_entries.values():
+            plan.delete_files += 1
+            plan.delete_bytes += size
+
+    plan.free_bytes = _free_space(dst)
+    plan.plan_seconds = time.perf_counter() - start
+    if tracer is not None:
+        tracer.record("plan", start, start + plan.plan_seconds)
+        tracer.count("files_scanned", plan.total_files)
+        tracer.count("files_to_copy", plan.copy_files)
+        tracer.count("folders_to_create", table.dir_count)
+    return plan
+
+
+def perform_backup(src, dst, logger, dry_run=False, update_progress=None, plan=None, tracer=None):
+    """
     Copy newer or missing files from src to dest.
     Uses logger(msg) to report status to GUI.
+    If plan is given (from plan_backup) it is used as-is instead of walking src again.
+    A file that cannot be copied is recorded in plan.errors and the run carries on.
+    tracer (tracing.Tracer) collects timings when the run is traced.
+    Returns the plan that was executed.
     """
+    span = tracer.span if tracer is not None else null_span
 
     # Check if source and destination directions exist
     if not os.path.isdir(src):
         logger("Source path is not a valid directory.")
-        return
-    
+        return None
+
+    if plan is None:
+        plan = plan_backup(src, dst, tracer=tracer)
+
+    if dry_run:
+        for src_file, dst_file, _ in plan.copy_paths():
+            logger(f"Would copy: {src_file} -> {dst_file}")
+        logger(plan.summary())
+        return plan
+
+    # Refuse to start a job that cannot fit on the destination
+    if not plan.fits:
+        msg = f"Not enough free space on destination: need {format_bytes(plan.needed_bytes)}, have {format_bytes(plan.free_bytes)}"
+        logger(msg)
+        raise InsufficientSpaceError(msg)
+
     logger("Starting backup...")
 
-    # Count the total number of files for the progress bar
-    total_files = sum(len(files) for _, _, files in os.walk(src))
+    # Create the destination subfolders, proceed forward if folder exists
+    with span("create_folders"):
+        for target_folder in plan.folders:
+            try:
+                os.makedirs(target_folder, exist_ok=True)
+            except OSError as e:
+                # The files inside will fail on their own and end up in the error report
+                logger(f"Could not create folder: {target_folder} ({e})")
+
+    total_files = plan.copy_files
     copied_files = 0
-    actually_copied = 0
-    
-    # Go through all folders and files in source
-    for foldername, _, filenames in os.walk(src): # we don't need subfolders, so it's ignored with '_'
-        # Create a relative path to maintain subfolder structure
-        rel_path = os.path.relpath(foldername, src)
-        target_folder = os.path.join(dst, rel_path)
-
-        # Create the destination subfolder if it doesn't exist, proceed forward if folder exists
-        if not dry_run:
-            os.makedirs(target_folder, exist_ok=True)
-
-        for filename in filenames:
-            src_file = os.path.join(foldername, filename)
-            dst_file = os.path.join(target_folder, filename)
-
-            # Only copy the file if it doesn't already exist at destination
-            # OR if the modification time on the source file is more recent
-            if not os.path.exists(dst_file) or os.path.getmtime(src_file) > os.path.getmtime(dst_file):
-                if dry_run:
-                    logger(f"Would copy: {src_file} -> {dst_file}")
+    errors_before = len(plan.errors)
+    run_start = time.perf_counter()
+    with span("copy_files", files=total_files):
+        for src_file, dst_file, size in plan.copy_paths():
+            with span("copy", file=src_file, size=size):
+                try:
+                    seconds = copy_with_retry(src_file, dst_file, logger)
+                except OSError as e:
+                    plan.errors.append((src_file, dst_file, size, str(e)))
+                    logger(f"Failed: {src_file} ({e})")
                 else:
-                    shutil.copy2(src_file, dst_file) # copy2 preserves metadata
+                    plan.copied_bytes += size
+                    plan.copy_seconds += seconds
                     logger(f"Copied: {src_file} -> {dst_file}")
-                actually_copied += 1
             copied_files += 1
             logger(f"Progress: {copied_files}/{total_files}")
-            if update_progress:
-                update_progress(copied_files, total_files, src_file, actually_copied)
-            time.sleep(0.001)
-        
-
-        if update_progress:
-            update_progress(copied_files, total_files, None, actually_copied)
-    logger("Backup complete.\n")
+            if tracer is None:
+                if update_progress:
+                    update_progress(copied_files, total_files, src_file, copied_files)
+                time.sleep(0.001)
+            else:
+                callback_start = time.perf_counter()
+                if update_progress:
+                    update_progress(copied_files, total_files, src_file, copied_files)
+                sleep_start = time.perf_counter()
+                time.sleep(0.001)
+                tracer.add_time("progress_callback", sleep_start - callback_start)
+                tracer.add_time("sleep", time.perf_counter() - sleep_start)
+    plan.run_seconds += time.perf_counter() - run_start
+
+    if tracer is not None:
+        tracer.count("files_copied", copied_files - (len(plan.errors) - errors_before))
+        tracer.count("bytes_copied", plan.copied_bytes)
+        tracer.count("copy_errors", len(plan.errors) - errors_before)
+
+    if update_progress:
+        update_progress(copied_files, total_files, None, copied_files)
+    if plan.errors:
+        logger(plan.error_report())
+        logger(f"Backup complete with {len(plan.errors)} error(s).\n")
+    else:
+        logger("Backup complete.\n")
+    return plan
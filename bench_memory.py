@@ -0,0 +1,100 @@
+"""
+Memory benchmark for the backup planner.
+Builds source trees of growing size with an up-to-date destination mirror and
+runs plan_backup on each in a fresh interpreter. Peak RSS should stay flat,
+because only files that need copying are kept. It then plans a first full
+backup of the same tree, where every file is kept, and checks the planner's
+peak memory per file against a budget.
+Exits with status 1 if peak RSS grows by more than the allowed margin or a
+full backup costs more than the budget per file:
+
+    python bench_memory.py [files ...]
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_SIZES = [10000, 40000, 160000]
+FILES_PER_DIR = 500
+# Directory levels between the tree root and the files, so folder rows matter
+DEPTH = 6
+
+# Allowed growth of peak RSS between the smallest and largest tree, in MB
+MAX_RSS_GROWTH_MB = 8
+# Planner peak memory per file when every file has to be copied, in bytes
+MAX_BYTES_PER_FILE = 64
+
+PROBE = """
+import resource, sys, tracemalloc
+import backup
+src, dst = sys.argv[1], sys.argv[2]
+tracemalloc.start()
+plan = backup.plan_backup(src, dst)
+table_peak = tracemalloc.get_traced_memory()[1]
+tracemalloc.stop()
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(rss_kb, table_peak, plan.total_files, plan.copy_files)
+"""
+
+
+def build_tree(root, files):
+    levels = [f"level_{n}_of_a_deep_tree" for n in range(DEPTH)]
+    for i in range(files):
+        folder = os.path.join(root, f"d{i // FILES_PER_DIR:05d}", *levels, f"sub{i % 7}")
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"file_{i:08d}.dat"), "wb"):
+            pass
+
+
+def probe(src, dst):
+    here = os.path.dirname(os.path.abspath(__file__))
+    out = subprocess.check_output([sys.executable, "-c", PROBE, src, dst], cwd=here, text=True)
+    rss_kb, table_peak, total, to_copy = (int(x) for x in out.split())
+    return rss_kb / 1024, table_peak, total, to_copy
+
+
+def main():
+    sizes = [int(x) for x in sys.argv[1:]] or DEFAULT_SIZES
+    base = tempfile.mkdtemp(prefix="bb_bench_")
+    rss = []
+    per_file = []
+    try:
+        for files in sizes:
+            src = os.path.join(base, f"src_{files}")
+            dst = os.path.join(base, f"dst_{files}")
+            empty = os.path.join(base, f"empty_{files}")
+            build_tree(src, files)
+            time.sleep(0.01)  # Mirror gets a newer mtime so nothing needs copying
+            build_tree(dst, files)
+
+            rss_mb, _, total, to_copy = probe(src, dst)
+            _, table_peak, _, full_copy = probe(src, empty)
+            rss.append(rss_mb)
+            per_file.append(table_peak / max(full_copy, 1))
+            print(f"{total:>9} files: peak RSS {rss_mb:6.1f} MB (up to date, {to_copy} to copy), "
+                  f"full copy planner peak {per_file[-1]:.0f} B/file")
+            shutil.rmtree(src)
+            shutil.rmtree(dst)
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+    growth = max(rss) - rss[0]
+    print(f"Peak RSS growth: {growth:.1f} MB (allowed {MAX_RSS_GROWTH_MB} MB)")
+    print(f"Full copy: up to {max(per_file):.0f} B/file (allowed {MAX_BYTES_PER_FILE} B/file)")
+    failed = False
+    if growth > MAX_RSS_GROWTH_MB:
+        print("FAIL: peak RSS grows with tree size")
+        failed = True
+    if max(per_file) > MAX_BYTES_PER_FILE:
+        print("FAIL: full copy plan uses too much memory per file")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
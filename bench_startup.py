@@ -0,0 +1,67 @@
+"""
+Startup benchmark for Backup-Buddy.
+Measures how long `import gui` takes in a fresh interpreter and checks that
+the heavy or platform-specific modules are not loaded before the window shows.
+Exits with status 1 if the import is slower than the budget or a deferred
+module got imported, so it can be run before a release:
+
+    python bench_startup.py [budget_ms]
+"""
+import os
+import subprocess
+import sys
+
+# Modules that must only be imported when a feature needs them
+DEFERRED_MODULES = ["backup", "utils", "win32com", "pythoncom"]
+
+# Default budget for `import gui` in milliseconds
+DEFAULT_BUDGET_MS = 250
+
+RUNS = 5
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import gui
+elapsed = time.perf_counter() - start
+loaded = [m for m in {deferred!r} if m in sys.modules]
+print(elapsed * 1000)
+print(",".join(loaded))
+"""
+
+
+def measure_once():
+    here = os.path.dirname(os.path.abspath(__file__))
+    out = subprocess.check_output(
+        [sys.executable, "-c", PROBE.format(deferred=DEFERRED_MODULES)],
+        cwd=here, text=True,
+    )
+    lines = out.split("\n")
+    elapsed, loaded = lines[0], lines[1]
+    return float(elapsed), [m for m in loaded.split(",") if m]
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BUDGET_MS
+    timings = []
+    loaded = []
+    for _ in range(RUNS):
+        elapsed, loaded = measure_once()
+        timings.append(elapsed)
+    best = min(timings)
+    print(f"import gui: best {best:.1f} ms, worst {max(timings):.1f} ms over {RUNS} runs (budget {budget:.0f} ms)")
+
+    failed = False
+    if loaded:
+        print(f"FAIL: deferred modules imported at startup: {', '.join(loaded)}")
+        failed = True
+    if best > budget:
+        print("FAIL: startup import is over budget")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,19 @@
 # external imports
 import os
+import queue
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, simpledialog
 import threading
 import time
 
 # backup-buddy units
-from scheduling import get_jobs, add_job, remove_job, update_job_status, update_job_last_run, get_next_run_time
-from backup import perform_backup
-import utils
+from scheduling import get_jobs, add_job, remove_job, update_job_status, update_job_last_run, update_job_throughput, get_run_window, is_job_due, parse_time
+# backup and utils (pywin32 on Windows) are imported where they are used, so the window shows up quickly at login
 
+# How often the main loop looks for the job list loaded in the background, in milliseconds
+JOB_LOAD_POLL_MS = 20
+# A scheduled job refused for lack of space is not tried again for this long (or before its window ends), in seconds
+SPACE_RETRY_DELAY = 60 * 60
 
 
 class BackupBuddyApp:
@@ -21,6 +25,8 @@ class BackupBuddyApp:
         self.job_pause_events = {}
         self.job_stop_events = {}
         self.job_progress = {}
+        self.job_status = {}  # In-memory status for this session only
+        self.job_refused_until = {}  # job_id: timestamp before which a job refused for lack of space is not scheduled
         self.selected_job_id = None
 
         # --- Top Buttons ---
@@ -61,10 +67,8 @@ class BackupBuddyApp:
         style.theme_use('default')
         style.configure("Thick.Horizontal.TProgressbar", thickness=16)
 
-        self.refresh_job_list()
-
-        # Start auto-scheduler in background
-        threading.Thread(target=self.auto_scheduler_loop, daemon=True).start()
+        # Jobs are read on a worker thread so reading jobs.json does not hold up the window
+        self.load_jobs_async()
 
         # --- Events Log Area at Bottom ---
         log_frame = tk.Frame(root, bd=2, relief="groove", height=120)
@@ -92,22 +96,40 @@ class BackupBuddyApp:
         self.jobs_area.bind("<Enter>", _bind_mousewheel)
         self.jobs_area.bind("<Leave>", _unbind_mousewheel)
 
+    def load_jobs_async(self):
+        # The worker only fills a queue; the main thread polls it once the main loop
+        # runs, because Tk must not be called from a thread before that
+        loaded = queue.Queue()
+        threading.Thread(target=lambda: loaded.put(get_jobs()), daemon=True).start()
+        self.root.after(JOB_LOAD_POLL_MS, self._poll_jobs_loaded, loaded)
+
+    def _poll_jobs_loaded(self, loaded):
+        try:
+            jobs = loaded.get_nowait()
+        except queue.Empty:
+            self.root.after(JOB_LOAD_POLL_MS, self._poll_jobs_loaded, loaded)
+            return
+        self._on_jobs_loaded(jobs)
+
+    def _on_jobs_loaded(self, jobs):
+        self.refresh_job_list(jobs)
+        # Start auto-scheduler in background once the job list is known
+        threading.Thread(target=self.auto_scheduler_loop, daemon=True).start()
+
     def safe_refresh_job_list(self):
         if threading.current_thread() is threading.main_thread():
             self.refresh_job_list()
         else:
             self.root.after(0, self.refresh_job_list)
 
-    def refresh_job_list(self):
+    def refresh_job_list(self, jobs=None):
         # Clear existing job frames
         for frame in self.job_frames.values():
             frame.destroy()
         self.job_frames.clear()
 
-        jobs = get_jobs()
-        # In-memory status for this session only
-        if not hasattr(self, 'job_status'):  # Only initialize once
-            self.job_status = {}
+        if jobs is None:
+            jobs = get_jobs()
         for job in jobs:
             job_id = job['id']
             # If job is new or app just started, set status to idle
@@ -146,6 +168,10 @@ class BackupBuddyApp:
         if status == 'idle':
             start_btn = tk.Button(btn_frame, text="Start Backup", command=lambda j=job: self.start_job(j, progress, btn_frame, status_label))
             start_btn.pack(side="left")
+            plan_btn = tk.Button(btn_frame, text="Plan", command=lambda j=job: self.plan_job(j))
+            plan_btn.pack(side="left")
+            trace_btn = tk.Button(btn_frame, text="Trace Run", command=lambda j=job: self.open_trace_window(j, progress, btn_frame, status_label))
+            trace_btn.pack(side="left")
             # Show last_run info in status_label
             last_run = job.get('last_run')
             if last_run:
@@ -220,6 +246,13 @@ class BackupBuddyApp:
         n_days_entry.grid(row=5, column=1, padx=5, pady=2)
         n_days_entry.insert(0, "3")
         n_days_entry.configure(state="disabled")
+        tk.Label(win, text="Window End (HH:MM):").grid(row=6, column=0, sticky="w")
+        window_entry = tk.Entry(win)
+        window_entry.grid(row=6, column=1, padx=5, pady=2)
+        tk.Label(win, text="Random Spread (min):").grid(row=7, column=0, sticky="w")
+        spread_entry = tk.Entry(win)
+        spread_entry.insert(0, "0")
+        spread_entry.grid(row=7, column=1, padx=5, pady=2)
         def toggle_n_days(*args):
             if interval_var.get() == "Every N Days":
                 n_days_entry.configure(state="normal")
@@ -232,15 +265,51 @@ class BackupBuddyApp:
             dst = dst_entry.get().strip()
             interval = interval_var.get()
             time_str = time_entry.get().strip()
-            n_days = int(n_days_entry.get()) if interval == 'Every N Days' else None
             if not name or not src or not dst or not time_str:
                 messagebox.showerror("Error", "All fields are required.")
                 return
-            add_job(name, src, dst, interval, time_str, n_days)
+            fields = self._parse_schedule_fields(win, time_str, n_days_entry.get() if interval == 'Every N Days' else None,
+                                                 window_entry.get(), spread_entry.get())
+            if fields is None:
+                return
+            time_str, n_days, window_end, spread = fields
+            add_job(name, src, dst, interval, time_str, n_days, window_end, spread)
             self.log_event(f"Job created: {name}")
             win.destroy()
             self.safe_refresh_job_list()
-        tk.Button(win, text="Create", command=create_job).grid(row=6, column=1, pady=5)
+        tk.Button(win, text="Create", command=create_job).grid(row=8, column=1, pady=5)
+
+    def _parse_schedule_fields(self, win, time_str, n_days_text, window_text, spread_text):
+        # Check the schedule fields of the job dialogs; shows an error and returns None on bad input
+        try:
+            time_str = parse_time(time_str)
+        except ValueError:
+            messagebox.showerror("Error", "Time must be HH:MM, e.g. 02:00.", parent=win)
+            return None
+        n_days = None
+        if n_days_text is not None:
+            try:
+                n_days = int(n_days_text)
+                if n_days < 1:
+                    raise ValueError(n_days_text)
+            except ValueError:
+                messagebox.showerror("Error", "N Days must be a whole number of at least 1.", parent=win)
+                return None
+        window_end = None
+        if window_text.strip():
+            try:
+                window_end = parse_time(window_text)
+            except ValueError:
+                messagebox.showerror("Error", "Window End must be HH:MM, e.g. 05:00, or empty for no window.", parent=win)
+                return None
+        try:
+            spread = int(spread_text.strip() or 0)
+            if spread < 0:
+                raise ValueError(spread_text)
+        except ValueError:
+            messagebox.showerror("Error", "Random Spread must be a whole number of minutes.", parent=win)
+            return None
+        return time_str, n_days, window_end, spread
 
     def browse_entry(self, entry):
         folder = filedialog.askdirectory()
@@ -258,8 +327,8 @@ class BackupBuddyApp:
             jobs = get_jobs()
             job = next((j for j in jobs if j['id'] == self.selected_job_id), None)
             if job:
-                add_job(new_name, job['source'], job['destination'], job['interval'], job['time'], job['n_days'])
-                remove_job(self.selected_job_id)
+                add_job(new_name, job['source'], job['destination'], job['interval'], job['time'], job['n_days'],
+                        job.get('window_end'), job.get('spread', 0), old_id=self.selected_job_id)
                 self.log_event(f"Job renamed: {self.selected_job_id} -> {new_name}")
                 #self.selected_job_id = new_name
                 self.refresh_job_list()
@@ -276,7 +345,7 @@ class BackupBuddyApp:
         self.selected_job_id = None
         self.safe_refresh_job_list()
 
-    def start_job(self, job, progress, btn_frame, status_label):
+    def start_job(self, job, progress, btn_frame, status_label, scheduled=False, window=None, trace=False, profile=None):
         job_id = job['id']
         pause_event = self.job_pause_events.setdefault(job_id, threading.Event())
         stop_event = self.job_stop_events.setdefault(job_id, threading.Event())
@@ -298,9 +367,29 @@ class BackupBuddyApp:
         status_label['text'] = ""
         status_label.update_idletasks()
 
+        # Scheduled runs back off while the machine is busy, manual runs go at full speed
+        throttle = None
+        if scheduled:
+            from throttle import Throttle, RUN, PAUSE
+            def on_throttle_change(level, reason):
+                if level == RUN:
+                    self.log_event(f"Job {job_id} running at full speed" + (f" ({reason})" if reason else ""))
+                else:
+                    self.log_event(f"Job {job_id} {'paused' if level == PAUSE else 'slowed down'}: {reason}")
+            deadline = window[1].timestamp() if window else None
+            throttle = Throttle(stop_event, deadline, notify=on_throttle_change)
+
+        # Traced runs record timers, a timeline and optionally a profile, see tracing.py
+        from tracing import Tracer, null_span
+        tracer = Tracer(job_id, profile) if trace else None
+        span = tracer.span if tracer else null_span
+        waited_seconds = 0.0  # Time spent paused by the user or held back by the throttle
+
         def progress_callback(current, total, filename=None, actually_copied=None):
-            percent = int((current / total) * 100)
+            nonlocal waited_seconds
+            percent = int((current / total) * 100) if total else 100
             def update_ui():
+                ui_start = time.perf_counter() if tracer else None
                 self.job_progress[job_id] = percent
                 prev_copied = getattr(self, '_last_files_copied', 0)
                 progress['value'] = percent
@@ -314,9 +403,21 @@ class BackupBuddyApp:
                 self._last_files_copied = actually_copied if actually_copied is not None else current
                 progress.update_idletasks()
                 status_label.update_idletasks()
+                if tracer:
+                    tracer.record("tk_update", ui_start, time.perf_counter())
             self.root.after(0, update_ui)
-            while pause_event.is_set():
-                threading.Event().wait(0.1)
+            if pause_event.is_set():
+                pause_start = time.perf_counter()
+                while pause_event.is_set():
+                    threading.Event().wait(0.1)
+                waited_seconds += time.perf_counter() - pause_start
+                if tracer:
+                    tracer.record("paused", pause_start, time.perf_counter())
+            if throttle and total:
+                throttle_start = time.perf_counter()
+                with span("throttle"):
+                    throttle.check(current / total)
+                waited_seconds += time.perf_counter() - throttle_start
             if stop_event.is_set():
                 raise Exception('Backup stopped by user.')
 
@@ -341,18 +442,100 @@ class BackupBuddyApp:
             self.root.after(0, self.refresh_job_list)
 
         def backup_thread():
+            from backup import perform_backup, plan_backup, InsufficientSpaceError, RETRY_PASS_DELAY
             success = False
+            if tracer:
+                tracer.start()
+            missing_source = f"Source path is not a valid directory: {job['source']}"
             try:
-                perform_backup(job['source'], job['destination'], log_callback, False, progress_callback)
+                if not os.path.isdir(job['source']):
+                    raise Exception(missing_source)
+                plan = plan_backup(job['source'], job['destination'], job.get('throughput'), tracer)
+                if throttle:
+                    throttle.eta_seconds = plan.eta_seconds
+                if perform_backup(job['source'], job['destination'], log_callback, False, progress_callback, plan, tracer) is None:
+                    raise Exception(missing_source)
+                # Pauses and throttling do not count, so they do not skew the throughput or the expected duration
+                update_job_throughput(job_id, plan.copied_bytes, plan.copy_seconds, plan.plan_seconds + plan.run_seconds - waited_seconds)
+                if plan.errors:
+                    # Give locked files a moment, then go over only the paths that failed
+                    self.log_event(f"Job {job_id}: {len(plan.errors)} file(s) failed, retrying in {RETRY_PASS_DELAY}s")
+                    self.root.after(0, lambda: status_label.config(text=f"Retrying {len(plan.errors)} failed file(s) in {RETRY_PASS_DELAY}s"))
+                    if stop_event.wait(RETRY_PASS_DELAY):
+                        raise Exception('Backup stopped by user.')
+                    plan = perform_backup(job['source'], job['destination'], log_callback, False, progress_callback, plan.retry_plan(), tracer)
+                    if plan is None:
+                        raise Exception(missing_source)
+                if plan.errors:
+                    self.log_event(f"Job {job_id}: {plan.error_report()}")
                 success = True
-            except Exception:
-                pass
+                self.job_refused_until.pop(job_id, None)
+            except InsufficientSpaceError:
+                msg = f"Job refused, not enough free space on destination: {job_id}"
+                if scheduled:
+                    # Walking the tree again every 30s will not free any space; report it once and back off
+                    retry_at = time.time() + SPACE_RETRY_DELAY
+                    if window:
+                        retry_at = max(retry_at, window[1].timestamp())
+                    if job_id not in self.job_refused_until:
+                        self.log_event(f"{msg} (trying again at {time.strftime('%Y-%m-%d %H:%M', time.localtime(retry_at))})")
+                    self.job_refused_until[job_id] = retry_at
+                else:
+                    self.log_event(msg)
+            except Exception as e:
+                if not stop_event.is_set():
+                    self.log_event(f"Job error: {job_id}: {e}")
+            if tracer:
+                tracer.stop()
+                try:
+                    files = tracer.save()
+                    self.log_event(f"Trace saved: {files[0]}\n{tracer.summary()}")
+                except OSError as e:
+                    self.log_event(f"Could not save trace for {job_id}: {e}")
             on_finish(success)
 
         t = threading.Thread(target=backup_thread, daemon=True)
         self.job_threads[job_id] = t
         t.start()
 
+    def open_trace_window(self, job, progress, btn_frame, status_label):
+        from tracing import PROFILE_NONE, PROFILE_SAMPLING, PROFILE_CPROFILE
+        win = tk.Toplevel(self.root)
+        win.title(f"Trace Run: {job['id']}")
+        win.grab_set()
+        win.focus_force()
+        win.resizable(False, False)
+        tk.Label(win, text="Profiler:").pack(anchor="w", padx=10, pady=(10, 0))
+        profile_var = tk.StringVar(value="none")
+        tk.Radiobutton(win, text="Timers and timeline only", variable=profile_var, value="none").pack(anchor="w", padx=20)
+        tk.Radiobutton(win, text="Sampling profiler", variable=profile_var, value=PROFILE_SAMPLING).pack(anchor="w", padx=20)
+        tk.Radiobutton(win, text="cProfile (slower)", variable=profile_var, value=PROFILE_CPROFILE).pack(anchor="w", padx=20)
+        def start_traced():
+            profile = profile_var.get()
+            win.destroy()
+            self.start_job(job, progress, btn_frame, status_label, trace=True,
+                           profile=PROFILE_NONE if profile == "none" else profile)
+        tk.Button(win, text="Start", command=start_traced).pack(pady=10)
+
+    def plan_job(self, job):
+        job_id = job['id']
+        self.log_event(f"Planning job: {job_id}")
+
+        def show_plan(plan):
+            if plan is None:
+                messagebox.showerror("Plan", f"Source path is not a valid directory:\n{job['source']}")
+                return
+            messagebox.showinfo(f"Plan: {job_id}", plan.summary())
+
+        def plan_thread():
+            from backup import plan_backup
+            plan = None
+            if os.path.isdir(job['source']):
+                plan = plan_backup(job['source'], job['destination'], job.get('throughput'))
+            self.root.after(0, show_plan, plan)
+
+        threading.Thread(target=plan_thread, daemon=True).start()
+
     def pause_job(self, job_id):
         self.job_pause_events[job_id].set()
         self.job_status[job_id] = 'paused'
@@ -420,23 +603,51 @@ class BackupBuddyApp:
 
     # --- Automatic Scheduler ---
     def auto_scheduler_loop(self):
+        from throttle import may_start
+        due_since = {}  # job_id: time the job became due but was held back
+        bad_jobs = set()  # Jobs whose schedule could not be read, reported once
         while True:
             jobs = get_jobs()
+            # The main thread changes job_status while this runs, so work on a copy
+            running = sum(1 for status in list(self.job_status.values()) if status != 'idle')
             for job in jobs:
                 job_id = job['id']
-                if self.job_status.get(job_id, 'idle') == 'idle':
-                    next_run = get_next_run_time(job)
-                    if next_run and time.time() >= next_run.timestamp():
-                        pause_event = self.job_pause_events.setdefault(job_id, threading.Event())
-                        stop_event = self.job_stop_events.setdefault(job_id, threading.Event())
-                        pause_event.clear()
-                        stop_event.clear()
-                        update_job_status(job_id, 'running')
-                        # Schedule widget lookup and job start on main thread
-                        self.root.after(0, self._start_job_by_id, job)
+                if time.time() < self.job_refused_until.get(job_id, 0):
+                    due_since.pop(job_id, None)
+                    continue
+                try:
+                    due = self.job_status.get(job_id, 'idle') == 'idle' and is_job_due(job)
+                    window = get_run_window(job) if due else None
+                except (ValueError, TypeError, AttributeError) as e:
+                    # A broken schedule (e.g. hand-edited config) must not stop the other jobs
+                    if job_id not in bad_jobs:
+                        bad_jobs.add(job_id)
+                        self.root.after(0, self.log_event, f"Job {job_id} has an invalid schedule: {e}")
+                    continue
+                bad_jobs.discard(job_id)
+                if not due:
+                    due_since.pop(job_id, None)
+                    continue
+                deadline = window[1].timestamp() if window else None
+                first_check = job_id not in due_since
+                waited = time.time() - due_since.setdefault(job_id, time.time())
+                start, reason = may_start(deadline, job.get('last_duration'), waited, running)
+                if not start:
+                    if first_check:
+                        self.root.after(0, self.log_event, f"Job {job_id} is due, waiting: {reason}")
+                    continue
+                due_since.pop(job_id, None)
+                pause_event = self.job_pause_events.setdefault(job_id, threading.Event())
+                stop_event = self.job_stop_events.setdefault(job_id, threading.Event())
+                pause_event.clear()
+                stop_event.clear()
+                update_job_status(job_id, 'running')
+                running += 1
+                # Schedule widget lookup and job start on main thread
+                self.root.after(0, self._start_job_by_id, job, window)
             time.sleep(30)
 
-    def _start_job_by_id(self, job):
+    def _start_job_by_id(self, job, window=None):
         job_id = job['id']
         frame = self.job_frames.get(job_id)
         if frame:
@@ -451,7 +662,7 @@ class BackupBuddyApp:
                 if isinstance(child, tk.Label):
                     status_label = child
             if btn_frame and progress and status_label:
-                self.start_job(job, progress, btn_frame, status_label)
+                self.start_job(job, progress, btn_frame, status_label, scheduled=True, window=window)
 
     def edit_selected_job(self):
         if not self.selected_job_id:
@@ -495,6 +706,14 @@ class BackupBuddyApp:
         n_days_entry.insert(0, str(n_days_val) if n_days_val is not None else "3")
         if interval_var.get() != "Every N Days":
             n_days_entry.configure(state="disabled")
+        tk.Label(win, text="Window End (HH:MM):").grid(row=6, column=0, sticky="w")
+        window_entry = tk.Entry(win)
+        window_entry.insert(0, job.get('window_end') or "")
+        window_entry.grid(row=6, column=1, padx=5, pady=2)
+        tk.Label(win, text="Random Spread (min):").grid(row=7, column=0, sticky="w")
+        spread_entry = tk.Entry(win)
+        spread_entry.insert(0, str(job.get('spread') or 0))
+        spread_entry.grid(row=7, column=1, padx=5, pady=2)
         def toggle_n_days(*args):
             if interval_var.get() == "Every N Days":
                 n_days_entry.configure(state="normal")
@@ -507,18 +726,21 @@ class BackupBuddyApp:
             dst = dst_entry.get().strip()
             interval = interval_var.get()
             time_str = time_entry.get().strip()
-            n_days = int(n_days_entry.get()) if interval == 'Every N Days' else None
             if not name or not src or not dst or not time_str:
                 messagebox.showerror("Error", "All fields are required.")
                 return
-            # Remove old job, add new/edited job
-            remove_job(job['id'])
-            add_job(name, src, dst, interval, time_str, n_days)
+            fields = self._parse_schedule_fields(win, time_str, n_days_entry.get() if interval == 'Every N Days' else None,
+                                                 window_entry.get(), spread_entry.get())
+            if fields is None:
+                return
+            time_str, n_days, window_end, spread = fields
+            # Replace the old job with the edited one, keeping its measured throughput
+            add_job(name, src, dst, interval, time_str, n_days, window_end, spread, old_id=job['id'])
             self.log_event(f"Job edited: {job['id']} -> {name}")
             self.selected_job_id = name
             win.destroy()
             self.safe_refresh_job_list()
-        tk.Button(win, text="Save", command=save_edits).grid(row=6, column=1, pady=5)
+        tk.Button(win, text="Save", command=save_edits).grid(row=8, column=1, pady=5)
 
     def open_settings_window(self):
         win = tk.Toplevel(self.root)
@@ -526,6 +748,7 @@ class BackupBuddyApp:
         win.grab_set()
         win.focus_force()
         win.resizable(False, False)
+        import utils
         # Checkbox for startup
         current = utils.is_in_startup(self)
         var = tk.BooleanVar()
@@ -1,11 +1,26 @@
 import json
 import os
+import random
 import time
 from datetime import datetime, timedelta
 
 CONFIG_FILE = "schedule_state.json"
 
-# Each job: {"id": str, "source": str, "destination": str, "interval": str, "time": str, "n_days": int|None, "last_run": str|None}
+# Each job: {"id": str, "source": str, "destination": str, "interval": str, "time": str, "n_days": int|None, "last_run": str|None,
+#               "throughput": float|None, "last_duration": float|None, "window_end": str|None, "spread": int}
+
+# Weight of the newest run when averaging measured throughput
+THROUGHPUT_SMOOTHING = 0.3
+
+# Check a time of day typed by the user and return it as HH:MM; raises ValueError if it is not one
+def parse_time(text):
+    hour, sep, minute = text.strip().partition(":")
+    if not sep or not hour.isdigit() or not minute.isdigit() or len(minute) != 2:
+        raise ValueError(f"Not a time of day (HH:MM): {text!r}")
+    hour, minute = int(hour), int(minute)
+    if hour > 23 or minute > 59:
+        raise ValueError(f"Not a time of day (HH:MM): {text!r}")
+    return f"{hour:02d}:{minute:02d}"
 
 # Load all scheduled backup jobs from the config file
 def load_jobs():
@@ -20,7 +35,8 @@ def save_jobs(jobs):
         json.dump(jobs, f, indent=4)
 
 # Add a new backup job or update an existing one (by name)
-def add_job(name, source, destination, interval, time_str, n_days=None):
+# old_id is the job being edited or renamed; it is replaced and its run history carried over
+def add_job(name, source, destination, interval, time_str, n_days=None, window_end=None, spread=0, old_id=None):
     jobs = load_jobs()
     job_id = name  # Use name as unique identifier
     job = {
@@ -31,11 +47,20 @@ def add_job(name, source, destination, interval, time_str, n_days=None):
         "interval": interval,  # Schedule interval (Daily, Weekly, Every N Days)
         "time": time_str,  # Time of day to run (HH:MM)
         "n_days": n_days,  # N for 'Every N Days', else None
-        "last_run": None  # Last time this job ran
+        "window_end": window_end,  # End of the run window (HH:MM), the window starts at "time"; None for no window
+        "spread": spread,  # Random delay after "time" in minutes, so jobs do not all start at once
+        "last_run": None,  # Last time this job ran
+        "throughput": None,  # Average bytes/second copied on past runs
+        "last_duration": None  # Seconds the last run took
         # No status field persisted
     }
-    # Remove any existing job with the same id (name)
-    jobs = [j for j in jobs if j["id"] != job_id]
+    # Keep the measured throughput when a job is edited, renamed or saved again under the same name
+    existing = next((j for j in jobs if j["id"] == (old_id or job_id)), None)
+    if existing:
+        job["throughput"] = existing.get("throughput")
+        job["last_duration"] = existing.get("last_duration")
+    # Remove the old job and any existing job with the same id (name)
+    jobs = [j for j in jobs if j["id"] not in (job_id, old_id)]
     jobs.append(job)
     save_jobs(jobs)
 
@@ -62,18 +87,80 @@ def update_job_last_run(job_id):
             job["last_run"] = datetime.now().isoformat()
     save_jobs(jobs)
 
+# Record the throughput of a finished run, averaged with earlier runs
+# seconds is the time spent copying; duration is how long the run needs without waits (defaults to seconds)
+def update_job_throughput(job_id, bytes_copied, seconds, duration=None):
+    if bytes_copied <= 0 or seconds <= 0:
+        return
+    measured = bytes_copied / seconds
+    jobs = load_jobs()
+    for job in jobs:
+        if job["id"] == job_id:
+            previous = job.get("throughput")
+            if previous:
+                job["throughput"] = previous + THROUGHPUT_SMOOTHING * (measured - previous)
+            else:
+                job["throughput"] = measured
+            job["last_duration"] = duration if duration is not None else seconds
+    save_jobs(jobs)
+
+# Return (start, end) of the run window that contains now, or the next one; None if the job has no window
+def get_run_window(job, now=None):
+    window_end = job.get("window_end")
+    if not window_end:
+        return None
+    now = now or datetime.now()
+    start_hour, start_minute = map(int, job["time"].split(":"))
+    end_hour, end_minute = map(int, window_end.split(":"))
+    start = now.replace(hour=start_hour, minute=start_minute, second=0, microsecond=0)
+    end = now.replace(hour=end_hour, minute=end_minute, second=0, microsecond=0)
+    if end <= start:
+        end += timedelta(days=1)  # Window runs past midnight, e.g. 23:00-03:00
+    # After midnight we may still be inside yesterday's window
+    if now < start and now < end - timedelta(days=1):
+        return start - timedelta(days=1), end - timedelta(days=1)
+    if now >= end:
+        return start + timedelta(days=1), end + timedelta(days=1)
+    return start, end
+
+# Random delay in minutes for a job on a given day; the same for the whole day so it does not jump around
+def _spread_minutes(job, day):
+    spread = job.get("spread") or 0
+    if spread <= 0:
+        return 0
+    window = get_run_window(job, datetime.combine(day, datetime.min.time()))
+    if window:
+        # Leave at least half of the window for the backup itself
+        spread = min(spread, (window[1] - window[0]).total_seconds() / 120)
+    return random.Random(f"{job['id']}:{day.isoformat()}").uniform(0, spread)
+
 # Calculate the next scheduled run time for a job
-def get_next_run_time(job):
+def get_next_run_time(job, now=None):
     """
     Returns the next scheduled run time for a job, based on its interval, time, and last_run.
     If the job has never run, schedule for the next occurrence after now.
     If the job has run, schedule for the next occurrence after last_run.
+    The job's random spread is added on top. now defaults to the current time.
     """
+    next_run = _get_base_run_time(job, now or datetime.now())
+    if next_run is None:
+        return None
+    return next_run + timedelta(minutes=_spread_minutes(job, next_run.date()))
+
+# Check whether a job may start now: it has to be due and, if it has a run window, inside it
+def is_job_due(job, now=None):
+    now = now or datetime.now()
+    next_run = get_next_run_time(job, now)
+    if not next_run or now < next_run:
+        return False
+    window = get_run_window(job, now)
+    return window is None or window[0] <= now < window[1]
+
+def _get_base_run_time(job, now):
     interval = job.get("interval")
     time_str = job.get("time")
     n_days = job.get("n_days")
     last_run = job.get("last_run")
-    now = datetime.now()
     hour, minute = map(int, time_str.split(":"))
     # Determine the base time to calculate from
     if last_run:
@@ -0,0 +1,197 @@
+import errno
+import os
+import shutil
+
+import pytest
+
+import backup
+from backup import FileTable, copy_with_retry, is_transient_error, plan_backup
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+# --- FileTable ---
+
+def test_file_table_round_trip():
+    table = FileTable()
+    odd_name = os.fsdecode(b"caf\xe9.txt")  # Not UTF-8, comes back surrogate-escaped
+    root = table.add_dir("")
+    table.add(root, "top.txt", 1)
+    deep = table.add_dir(os.path.join("a", "b", "c"))
+    table.add(deep, "deep.txt", 2)
+    table.add(deep, odd_name, 3)
+    table.add_dir(os.path.join("a", "empty"))
+    assert list(table) == [
+        ("", "top.txt", 1),
+        (os.path.join("a", "b", "c"), "deep.txt", 2),
+        (os.path.join("a", "b", "c"), odd_name, 3),
+    ]
+    assert table.dirs == ["", "a", os.path.join("a", "b"), os.path.join("a", "b", "c"), os.path.join("a", "empty")]
+    assert table.add_dir(os.path.join("a", "b")) == 2  # Same row for the same folder
+    assert len(table) == 3
+
+
+def test_plan_backup_keeps_empty_and_nested_folders(tmp_path):
+    src = tmp_path / "src"
+    dst = tmp_path / "dst"
+    odd_name = os.fsdecode(b"caf\xe9.txt")
+    write(str(src / "a" / "b" / "file.txt"), b"data")
+    write(os.path.join(str(src), "a", odd_name), b"odd")
+    os.makedirs(src / "empty" / "inner")
+    plan = plan_backup(str(src), str(dst))
+    assert sorted(name for _, name, _ in plan.copies) == sorted(["file.txt", odd_name])
+    folders = set(plan.folders)
+    for rel in ["a", os.path.join("a", "b"), "empty", os.path.join("empty", "inner")]:
+        assert str(dst / rel) in folders
+    backup.perform_backup(str(src), str(dst), lambda msg: None, plan=plan)
+    assert os.path.isdir(dst / "empty" / "inner")
+    with open(os.path.join(str(dst), "a", odd_name), "rb") as f:
+        assert f.read() == b"odd"
+
+
+# --- is_transient_error ---
+
+@pytest.mark.parametrize("code", [errno.EIO, errno.EBUSY, errno.ETIMEDOUT, errno.EAGAIN])
+def test_transient_errnos(code):
+    assert is_transient_error(OSError(code, os.strerror(code)))
+
+
+@pytest.mark.parametrize("code", [errno.ENOENT, errno.EACCES, errno.ENOSPC])
+def test_permanent_errnos(code):
+    assert not is_transient_error(OSError(code, os.strerror(code)))
+
+
+@pytest.mark.parametrize("winerror, transient", [(32, True), (33, True), (64, True), (5, False), (2, False)])
+def test_windows_errors(winerror, transient):
+    e = OSError(errno.EACCES, "Windows error")
+    e.winerror = winerror  # Only set by Python on Windows
+    assert is_transient_error(e) == transient
+
+
+def test_non_os_errors_are_not_transient():
+    assert not is_transient_error(ValueError("bad"))
+
+
+# --- copy_with_retry ---
+
+def test_copy_with_retry_copies_file(tmp_path):
+    src = tmp_path / "src.txt"
+    dst = tmp_path / "dst.txt"
+    write(str(src), b"hello")
+    copy_with_retry(str(src), str(dst), lambda msg: None)
+    assert dst.read_bytes() == b"hello"
+    assert sorted(os.listdir(tmp_path)) == ["dst.txt", "src.txt"]
+
+
+def test_failed_copy_leaves_no_partial_file(tmp_path, monkeypatch):
+    src = tmp_path / "src.txt"
+    dst = tmp_path / "out" / "dst.txt"
+    write(str(src), b"x" * 1000)
+    os.makedirs(dst.parent)
+
+    def failing_copy(src_file, dst_file):
+        # Write half the file, then fail the way a dropped network share does
+        with open(dst_file, "wb") as f:
+            f.write(b"x" * 500)
+        raise OSError(errno.EIO, "Input/output error")
+
+    monkeypatch.setattr(shutil, "copy2", failing_copy)
+    with pytest.raises(OSError):
+        copy_with_retry(str(src), str(dst), lambda msg: None, attempts=2, base_delay=0)
+    assert os.listdir(dst.parent) == []
+
+
+def test_failed_copy_keeps_old_destination(tmp_path, monkeypatch):
+    src = tmp_path / "src.txt"
+    dst = tmp_path / "dst.txt"
+    write(str(src), b"new")
+    write(str(dst), b"old")
+
+    def failing_copy(src_file, dst_file):
+        with open(dst_file, "wb") as f:
+            f.write(b"n")
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(shutil, "copy2", failing_copy)
+    with pytest.raises(OSError):
+        copy_with_retry(str(src), str(dst), lambda msg: None, base_delay=0)
+    assert dst.read_bytes() == b"old"
+    assert sorted(os.listdir(tmp_path)) == ["dst.txt", "src.txt"]
+
+
+# --- retry_plan ---
+
+def test_retry_plan_after_file_error(tmp_path):
+    src = tmp_path / "src"
+    dst = tmp_path / "dst"
+    write(str(src / "sub" / "locked.txt"), b"12345")
+    plan = backup.BackupPlan(str(src), str(dst))
+    plan.errors.append((str(src / "sub" / "locked.txt"), str(dst / "sub" / "locked.txt"), 5, "in use"))
+    retry = plan.retry_plan()
+    assert list(retry.copy_paths()) == [(str(src / "sub" / "locked.txt"), str(dst / "sub" / "locked.txt"), 5)]
+    assert retry.copy_bytes == 5
+    assert retry.errors == []
+
+
+def test_retry_plan_after_folder_error(tmp_path, monkeypatch):
+    src = tmp_path / "src"
+    dst = tmp_path / "dst"
+    write(str(src / "ok.txt"), b"ok")
+    write(str(src / "locked" / "inner" / "a.txt"), b"aaa")
+    os.makedirs(src / "locked" / "empty")
+    real_scandir = os.scandir
+
+    def scandir(path):
+        if os.path.basename(path) == "locked":
+            raise PermissionError(errno.EACCES, "Permission denied", path)
+        return real_scandir(path)
+
+    monkeypatch.setattr(os, "scandir", scandir)
+    plan = plan_backup(str(src), str(dst))
+    assert [name for _, name, _ in plan.copies] == ["ok.txt"]
+    assert plan.errors[0][:3] == (str(src / "locked"), str(dst / "locked"), None)
+
+    monkeypatch.setattr(os, "scandir", real_scandir)
+    retry = plan.retry_plan()
+    assert list(retry.copy_paths()) == [(str(src / "locked" / "inner" / "a.txt"), str(dst / "locked" / "inner" / "a.txt"), 3)]
+    assert str(dst / "locked" / "empty") in retry.folders
+    assert retry.errors == []
+
+
+def test_retry_plan_skips_folder_that_was_removed(tmp_path):
+    src = tmp_path / "src"
+    dst = tmp_path / "dst"
+    os.makedirs(src / "gone")
+    plan = backup.BackupPlan(str(src), str(dst))
+    plan.errors.append((str(src / "gone"), str(dst / "gone"), None, "Folder could not be read"))
+    shutil.rmtree(src / "gone")
+    retry = plan.retry_plan()
+    assert retry.copy_files == 0
+    assert retry.copies.dir_count == 0
+
+
+# --- perform_backup ---
+
+def test_perform_backup_copies_tree_and_times_the_run(tmp_path):
+    src = tmp_path / "src"
+    dst = tmp_path / "dst"
+    write(str(src / "a.txt"), b"a")
+    write(str(src / "sub" / "b.txt"), b"bb")
+    plan = backup.perform_backup(str(src), str(dst), lambda msg: None)
+    assert (dst / "a.txt").read_bytes() == b"a"
+    assert (dst / "sub" / "b.txt").read_bytes() == b"bb"
+    assert plan.copied_bytes == 3
+    # The run includes the time between files, not only the copies
+    assert plan.run_seconds >= plan.copy_seconds + 2 * 0.001
+
+
+def test_eta_counts_per_file_overhead(tmp_path):
+    plan = backup.BackupPlan(str(tmp_path), str(tmp_path))
+    for i in range(1000):
+        plan.copies.add(plan.copies.add_dir(""), f"f{i}", 0)
+    plan.throughput = 1e6
+    assert plan.eta_seconds == pytest.approx(1000 * backup.FILE_OVERHEAD)
@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from scheduling import get_next_run_time, get_run_window, is_job_due, parse_time, _spread_minutes
+
+
+def make_job(time="23:00", window_end=None, spread=0, last_run=None, interval="Daily"):
+    return {
+        "id": "test", "name": "test", "source": "src", "destination": "dst",
+        "interval": interval, "time": time, "n_days": None,
+        "window_end": window_end, "spread": spread, "last_run": last_run,
+    }
+
+
+def at(text):
+    return datetime.fromisoformat(text)
+
+
+# --- parse_time ---
+
+@pytest.mark.parametrize("text, expected", [("02:00", "02:00"), ("6:08", "06:08"), (" 23:59 ", "23:59")])
+def test_parse_time_accepts_times_of_day(text, expected):
+    assert parse_time(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "5am", "25:00", "12:60", "12:5", "-1:00", "12"])
+def test_parse_time_rejects_everything_else(text):
+    with pytest.raises(ValueError):
+        parse_time(text)
+
+
+# --- get_run_window ---
+
+def test_no_window_without_window_end():
+    assert get_run_window(make_job(), at("2026-10-19T12:00")) is None
+
+
+def test_same_day_window_ahead_inside_and_after():
+    job = make_job(time="01:00", window_end="05:00")
+    today = (at("2026-10-19T01:00"), at("2026-10-19T05:00"))
+    assert get_run_window(job, at("2026-10-19T00:30")) == today
+    assert get_run_window(job, at("2026-10-19T03:00")) == today
+    assert get_run_window(job, at("2026-10-19T05:00")) == (at("2026-10-20T01:00"), at("2026-10-20T05:00"))
+
+
+def test_overnight_window_before_midnight():
+    job = make_job(time="23:00", window_end="03:00")
+    assert get_run_window(job, at("2026-10-19T23:30")) == (at("2026-10-19T23:00"), at("2026-10-20T03:00"))
+
+
+def test_overnight_window_after_midnight_is_yesterdays_window():
+    job = make_job(time="23:00", window_end="03:00")
+    assert get_run_window(job, at("2026-10-20T00:00")) == (at("2026-10-19T23:00"), at("2026-10-20T03:00"))
+    assert get_run_window(job, at("2026-10-20T02:59")) == (at("2026-10-19T23:00"), at("2026-10-20T03:00"))
+
+
+def test_overnight_window_during_the_day_is_tonights_window():
+    job = make_job(time="23:00", window_end="03:00")
+    assert get_run_window(job, at("2026-10-20T03:00")) == (at("2026-10-20T23:00"), at("2026-10-21T03:00"))
+    assert get_run_window(job, at("2026-10-20T12:00")) == (at("2026-10-20T23:00"), at("2026-10-21T03:00"))
+
+
+# --- _spread_minutes ---
+
+def test_spread_is_zero_without_spread():
+    assert _spread_minutes(make_job(), at("2026-10-19").date()) == 0
+
+
+def test_spread_is_stable_for_a_day_and_within_limit():
+    job = make_job(spread=30)
+    day = at("2026-10-19").date()
+    first = _spread_minutes(job, day)
+    assert first == _spread_minutes(job, day)
+    assert 0 <= first <= 30
+
+
+def test_spread_changes_between_days():
+    job = make_job(spread=30)
+    days = [at("2026-10-19").date() + timedelta(days=n) for n in range(10)]
+    assert len({_spread_minutes(job, day) for day in days}) > 1
+
+
+def test_spread_uses_at_most_half_the_window():
+    job = make_job(time="01:00", window_end="01:20", spread=600)
+    for n in range(20):
+        assert _spread_minutes(job, at("2026-10-19").date() + timedelta(days=n)) <= 10
+
+
+# --- get_next_run_time / is_job_due ---
+
+def test_next_run_time_uses_given_now():
+    job = make_job(time="02:00")
+    assert get_next_run_time(job, at("2026-10-19T01:00")) == at("2026-10-19T02:00")
+    # Never run and the time already passed today: run right away
+    assert get_next_run_time(job, at("2026-10-19T03:00")) == at("2026-10-19T02:00")
+
+
+def test_next_run_time_adds_spread():
+    job = make_job(time="02:00", spread=30, last_run="2026-10-18T02:10:00")
+    next_run = get_next_run_time(job, at("2026-10-19T01:00"))
+    assert at("2026-10-19T02:00") <= next_run <= at("2026-10-19T02:30")
+
+
+def test_due_inside_overnight_window_after_midnight():
+    job = make_job(time="23:00", window_end="03:00", last_run="2026-10-18T23:10:00")
+    assert is_job_due(job, at("2026-10-20T01:00"))
+
+
+def test_not_due_again_inside_the_window_it_already_ran_in():
+    job = make_job(time="23:00", window_end="03:00", last_run="2026-10-19T23:10:00")
+    assert not is_job_due(job, at("2026-10-20T01:00"))
+
+
+def test_not_due_outside_window_even_if_overdue():
+    job = make_job(time="23:00", window_end="03:00", last_run="2026-10-10T23:10:00")
+    assert not is_job_due(job, at("2026-10-20T12:00"))
+    assert is_job_due(job, at("2026-10-20T23:30"))
+
+
+def test_due_without_window_once_time_has_passed():
+    job = make_job(time="02:00", last_run="2026-10-18T02:00:00")
+    assert not is_job_due(job, at("2026-10-19T01:59"))
+    assert is_job_due(job, at("2026-10-19T02:00"))
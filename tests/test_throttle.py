@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+
+import throttle
+from throttle import PAUSE, RUN, SLOW, Throttle, may_start
+
+
+@pytest.fixture
+def machine(monkeypatch):
+    """Fake system readings; tests set load, io and battery on the returned dict."""
+    state = {"load": None, "io": None, "battery": False}
+    monkeypatch.setattr(throttle, "read_cpu_load", lambda: state["load"])
+    monkeypatch.setattr(throttle, "read_io_pressure", lambda: state["io"])
+    monkeypatch.setattr(throttle, "on_battery", lambda: state["battery"])
+    monkeypatch.setattr(throttle, "MIN_LEVEL_SECONDS", 0)
+    return state
+
+
+def make_throttle(level=RUN, deadline=None):
+    t = Throttle(threading.Event(), deadline)
+    t.level = level
+    return t
+
+
+# --- check_conditions ---
+
+def test_check_conditions_levels(machine):
+    assert throttle.check_conditions()[0] == RUN
+    machine["load"] = throttle.LOAD_SLOW
+    assert throttle.check_conditions()[0] == SLOW
+    machine["io"] = throttle.IO_PAUSE
+    assert throttle.check_conditions()[0] == PAUSE
+    machine["load"] = machine["io"] = None
+    machine["battery"] = True
+    assert throttle.check_conditions()[0] == PAUSE
+
+
+# --- Throttle ---
+
+def test_steps_up_as_soon_as_limits_are_reached(machine):
+    t = make_throttle()
+    machine["load"] = throttle.LOAD_SLOW
+    t._update(0.0)
+    assert t.level == SLOW
+
+
+def test_stays_slow_until_load_is_well_below_limit(machine):
+    t = make_throttle(SLOW)
+    machine["load"] = throttle.LOAD_SLOW * 0.9
+    t._update(0.0)
+    assert t.level == SLOW
+    machine["load"] = throttle.LOAD_SLOW * throttle.RESUME_FACTOR * 0.9
+    t._update(0.0)
+    assert t.level == RUN
+
+
+def test_dropping_load_never_raises_the_level(machine):
+    # Below LOAD_SLOW, but above LOAD_PAUSE * RESUME_FACTOR
+    t = make_throttle(SLOW)
+    machine["load"] = throttle.LOAD_PAUSE * throttle.RESUME_FACTOR + 0.01
+    assert machine["load"] < throttle.LOAD_SLOW
+    t._update(0.0)
+    assert t.level == SLOW
+
+
+def test_paused_job_steps_down_to_slow(machine):
+    t = make_throttle(PAUSE)
+    machine["load"] = throttle.LOAD_SLOW * 0.9
+    t._update(0.0)
+    assert t.level == SLOW
+
+
+def test_level_is_held_for_min_level_seconds(machine, monkeypatch):
+    monkeypatch.setattr(throttle, "MIN_LEVEL_SECONDS", 60)
+    t = make_throttle()
+    machine["load"] = throttle.LOAD_PAUSE
+    t._update(0.0)
+    assert t.level == RUN
+    t._level_since = time.monotonic() - 61
+    t._update(0.0)
+    assert t.level == PAUSE
+
+
+def test_runs_at_full_speed_when_deadline_is_near(machine):
+    t = make_throttle(PAUSE, deadline=time.time() + throttle.DEADLINE_MARGIN / 2)
+    machine["load"] = throttle.LOAD_PAUSE
+    t._update(0.0)
+    assert t.level == RUN
+
+
+def test_check_returns_when_stopped_while_paused(machine, monkeypatch):
+    monkeypatch.setattr(throttle, "CHECK_INTERVAL", 0.01)
+    t = make_throttle()
+    machine["battery"] = True
+    t.stop_event.set()
+    t.check(0.0)
+    assert t.level == PAUSE
+
+
+# --- may_start ---
+
+def test_may_start_when_machine_is_idle(machine):
+    assert may_start() == (True, "")
+
+
+def test_may_start_holds_back_while_busy(machine):
+    machine["io"] = throttle.IO_PAUSE
+    start, reason = may_start()
+    assert not start
+    assert "I/O" in reason
+
+
+def test_may_start_waits_for_other_jobs(machine):
+    assert may_start(others_running=1) == (False, "other jobs are running")
+
+
+def test_may_start_when_deadline_would_be_missed(machine):
+    machine["battery"] = True
+    assert may_start(deadline=time.time() + 60, expected_seconds=0, others_running=1) == (True, "deadline")
+    assert may_start(deadline=time.time() + 24 * 3600, expected_seconds=60)[0] is False
+
+
+def test_may_start_after_waiting_too_long(machine):
+    machine["battery"] = True
+    assert may_start(waited=throttle.MAX_PAUSE) == (True, "waited too long")
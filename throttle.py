@@ -0,0 +1,223 @@
+import os
+import sys
+import time
+
+# Levels returned by check_conditions()
+RUN = "run"
+SLOW = "slow"
+PAUSE = "pause"
+
+# 1-minute load average per CPU core
+LOAD_SLOW = 0.8
+LOAD_PAUSE = 1.5
+# Share of time tasks were stalled on I/O over the last 10s (/proc/pressure/io "some avg10"), in percent
+IO_SLOW = 10.0
+IO_PAUSE = 40.0
+
+# How often a running job looks at the system again, in seconds
+CHECK_INTERVAL = 5.0
+# A running job stays at a level at least this long before it changes again, in seconds.
+# The backup adds to the load and I/O pressure itself, so without this it would
+# pause, let the pressure drop, resume and pause again every few seconds.
+MIN_LEVEL_SECONDS = 60.0
+# To step down to a lower level, load and pressure have to fall below the limits times this
+RESUME_FACTOR = 0.5
+# Extra delay per file while slowed down, in seconds
+SLOW_DELAY = 0.05
+# A job without a deadline never waits longer than this in total, in seconds
+MAX_PAUSE = 30 * 60
+# Stop throttling this long before the deadline would be missed, in seconds
+DEADLINE_MARGIN = 5 * 60
+
+PRESSURE_FILE = "/proc/pressure/io"
+POWER_SUPPLY_DIR = "/sys/class/power_supply"
+
+
+def read_cpu_load():
+    """Return the 1-minute load average per core, or None if the OS has no load average."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+
+def read_io_pressure():
+    """Return the 'some avg10' I/O pressure in percent, or None where PSI is not available."""
+    try:
+        with open(PRESSURE_FILE) as f:
+            for line in f:
+                if line.startswith("some"):
+                    for field in line.split()[1:]:
+                        key, _, value = field.partition("=")
+                        if key == "avg10":
+                            return float(value)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _read_text(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def on_battery():
+    """Return True when running on battery, False on AC power, None if it cannot be told."""
+    if os.name == 'nt':
+        try:
+            import ctypes
+
+            class SYSTEM_POWER_STATUS(ctypes.Structure):
+                _fields_ = [
+                    ("ACLineStatus", ctypes.c_byte),
+                    ("BatteryFlag", ctypes.c_byte),
+                    ("BatteryLifePercent", ctypes.c_byte),
+                    ("SystemStatusFlag", ctypes.c_byte),
+                    ("BatteryLifeTime", ctypes.c_ulong),
+                    ("BatteryFullLifeTime", ctypes.c_ulong),
+                ]
+            status = SYSTEM_POWER_STATUS()
+            if not ctypes.windll.kernel32.GetSystemPowerStatus(ctypes.byref(status)):
+                return None
+            if status.ACLineStatus in (0, 1):
+                return status.ACLineStatus == 0
+        except Exception:
+            pass
+        return None
+    elif sys.platform.startswith('linux'):
+        try:
+            supplies = os.listdir(POWER_SUPPLY_DIR)
+        except OSError:
+            return None
+        mains_online = None
+        discharging = False
+        for name in supplies:
+            folder = os.path.join(POWER_SUPPLY_DIR, name)
+            kind = _read_text(os.path.join(folder, "type"))
+            if kind == "Mains":
+                online = _read_text(os.path.join(folder, "online")) == "1"
+                mains_online = bool(mains_online) or online
+            elif kind == "Battery":
+                discharging = discharging or _read_text(os.path.join(folder, "status")) == "Discharging"
+        if mains_online is not None:
+            return not mains_online
+        return discharging or None
+    return None
+
+
+# Order of the levels, to tell stepping up from stepping down
+_LEVEL_ORDER = {RUN: 0, SLOW: 1, PAUSE: 2}
+
+
+def check_conditions(factor=1.0):
+    """
+    Look at CPU load, I/O pressure and power source.
+    The load and pressure limits are multiplied by factor.
+    Returns (level, reason) where level is RUN, SLOW or PAUSE.
+    """
+    if on_battery():
+        return PAUSE, "on battery power"
+    io = read_io_pressure()
+    if io is not None and io >= IO_PAUSE * factor:
+        return PAUSE, f"high I/O pressure ({io:.0f}%)"
+    load = read_cpu_load()
+    if load is not None and load >= LOAD_PAUSE * factor:
+        return PAUSE, f"high system load ({load:.1f} per core)"
+    if io is not None and io >= IO_SLOW * factor:
+        return SLOW, f"I/O pressure ({io:.0f}%)"
+    if load is not None and load >= LOAD_SLOW * factor:
+        return SLOW, f"system load ({load:.1f} per core)"
+    return RUN, ""
+
+
+class Throttle:
+    """
+    Slows down or pauses a running job while the machine is busy.
+    deadline is the Unix timestamp the job has to be done by, or None.
+    eta_seconds is the estimated duration of the whole run, used to stop throttling
+    once waiting any longer would miss the deadline.
+    notify(level, reason) is called whenever the level changes.
+    """
+
+    def __init__(self, stop_event, deadline=None, eta_seconds=None, notify=None):
+        self.stop_event = stop_event
+        self.deadline = deadline
+        self.eta_seconds = eta_seconds
+        self.notify = notify
+        self.level = RUN
+        self.reason = ""
+        self.paused_seconds = 0.0
+        self._last_check = 0.0
+        self._level_since = time.monotonic()
+
+    def behind_schedule(self, fraction_done):
+        """True if the job has to run at full speed to finish before the deadline."""
+        if self.deadline is None:
+            return self.paused_seconds >= MAX_PAUSE
+        remaining = (self.eta_seconds or 0) * (1 - fraction_done)
+        return time.time() + remaining + DEADLINE_MARGIN >= self.deadline
+
+    def _set_level(self, level, reason):
+        if level != self.level:
+            self.level = level
+            self.reason = reason
+            self._level_since = time.monotonic()
+            if self.notify:
+                self.notify(level, reason)
+
+    def check(self, fraction_done=0.0):
+        """
+        Called between files. Returns right away while conditions are fine,
+        sleeps a little while slowed down and blocks while paused.
+        """
+        now = time.monotonic()
+        if now - self._last_check >= CHECK_INTERVAL:
+            self._last_check = now
+            self._update(fraction_done)
+        while self.level == PAUSE:
+            started = time.monotonic()
+            if self.stop_event.wait(CHECK_INTERVAL):
+                return
+            self.paused_seconds += time.monotonic() - started
+            self._last_check = time.monotonic()
+            self._update(fraction_done)
+        if self.level == SLOW:
+            time.sleep(SLOW_DELAY)
+
+    def _update(self, fraction_done):
+        if self.behind_schedule(fraction_done):
+            self._set_level(RUN, "deadline")
+            return
+        if time.monotonic() - self._level_since < MIN_LEVEL_SECONDS:
+            return
+        level, reason = check_conditions()
+        if _LEVEL_ORDER[level] < _LEVEL_ORDER[self.level]:
+            # Hysteresis: only step down once things are well below the limits.
+            # The lowered limits can still be above a lower level's, so never step up here.
+            level, reason = check_conditions(RESUME_FACTOR)
+            if _LEVEL_ORDER[level] > _LEVEL_ORDER[self.level]:
+                level, reason = self.level, self.reason
+        self._set_level(level, reason)
+
+
+def may_start(deadline=None, expected_seconds=None, waited=0.0, others_running=0):
+    """
+    Decide whether a due job should start now.
+    Returns (start, reason). A job is held back while other jobs run or the machine
+    is busy, unless holding it any longer would miss its deadline (or, without a
+    deadline, it has already waited MAX_PAUSE seconds).
+    """
+    if deadline is not None:
+        if time.time() + (expected_seconds or 0) + DEADLINE_MARGIN >= deadline:
+            return True, "deadline"
+    elif waited >= MAX_PAUSE:
+        return True, "waited too long"
+    if others_running:
+        return False, "other jobs are running"
+    level, reason = check_conditions()
+    if level == PAUSE:
+        return False, reason
+    return True, ""
@@ -0,0 +1,244 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+TRACE_DIR = "traces"
+
+# Profilers a traced run can use
+PROFILE_NONE = None
+PROFILE_CPROFILE = "cprofile"
+PROFILE_SAMPLING = "sampling"
+
+# Timeline events kept per run; timers and counters keep adding up after that
+MAX_EVENTS = 200000
+# Seconds between stack samples for the sampling profiler
+SAMPLE_INTERVAL = 0.005
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def null_span(name, **args):
+    """Stand-in for Tracer.span when tracing is off, so call sites need no checks."""
+    return _NULL_SPAN
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class Tracer:
+    """
+    Collects per-phase timers, counters and a timeline for one job run.
+    The timeline can be saved as Chrome trace-event JSON (chrome://tracing or Perfetto),
+    with one track per thread. Optionally runs cProfile or a sampling profiler
+    between start() and stop().
+    Nothing here runs unless a job is started with tracing on; code paths take
+    tracer=None and use null_span otherwise.
+    """
+
+    def __init__(self, name, profile=PROFILE_NONE):
+        self.name = name
+        self.profile = profile
+        self.timers = {}  # name: [total seconds, calls]
+        self.counters = Counter()
+        self.events = []
+        self.dropped_events = 0
+        self.thread_names = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._started = None
+        self._stopped = None
+        self._profiler = None
+        self._sampler = None
+
+    # --- Collecting ---
+    def span(self, name, **args):
+        """Context manager that times a block and adds it to the timeline."""
+        return _Span(self, name, args)
+
+    def record(self, name, start, end, args=None):
+        """Add a finished span measured with time.perf_counter()."""
+        ident = threading.get_ident()
+        with self._lock:
+            self._add_time(name, end - start)
+            if ident not in self.thread_names:
+                self.thread_names[ident] = threading.current_thread().name
+            if len(self.events) < MAX_EVENTS:
+                self.events.append((name, start, end, ident, args))
+            else:
+                self.dropped_events += 1
+
+    def add_time(self, name, seconds):
+        """Add time to a timer without putting an event on the timeline (for very hot spots)."""
+        with self._lock:
+            self._add_time(name, seconds)
+
+    def _add_time(self, name, seconds):
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [seconds, 1]
+        else:
+            timer[0] += seconds
+            timer[1] += 1
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    # --- Profiling ---
+    def start(self):
+        self._started = time.perf_counter()
+        if self.profile == PROFILE_CPROFILE:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile == PROFILE_SAMPLING:
+            self._sampler = _Sampler(threading.get_ident())
+            self._sampler.start()
+
+    def stop(self):
+        self._stopped = time.perf_counter()
+        if self._profiler:
+            self._profiler.disable()
+        if self._sampler:
+            self._sampler.stop()
+
+    # --- Reporting ---
+    @property
+    def elapsed(self):
+        if self._started is None:
+            return 0.0
+        return (self._stopped or time.perf_counter()) - self._started
+
+    def summary(self):
+        lines = [f"Trace of {self.name}: {self.elapsed:.2f}s total"]
+        for name, (total, calls) in sorted(self.timers.items(), key=lambda item: -item[1][0]):
+            lines.append(f"  {name}: {total:.3f}s in {calls} call(s)")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"  {name}: {value}")
+        if self.dropped_events:
+            lines.append(f"  ({self.dropped_events} timeline events dropped after {MAX_EVENTS})")
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        """Return the run as a Chrome trace-event dict."""
+        pid = os.getpid()
+        trace_events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"Backup-Buddy: {self.name}"}}]
+        for ident, thread_name in self.thread_names.items():
+            trace_events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": ident, "args": {"name": thread_name}})
+        for name, start, end, ident, args in self.events:
+            event = {
+                "name": name, "ph": "X", "pid": pid, "tid": ident,
+                "ts": (start - self._origin) * 1e6, "dur": (end - start) * 1e6,
+            }
+            if args:
+                event["args"] = args
+            trace_events.append(event)
+        counters = dict(self.counters)
+        counters.update({f"{name}_seconds": round(total, 6) for name, (total, _) in self.timers.items()})
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms", "otherData": counters}
+
+    def export_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def save(self, directory=TRACE_DIR):
+        """
+        Write the Chrome trace, the summary and any profile to directory.
+        Returns the list of files written.
+        """
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        base = os.path.join(directory, f"{_safe_name(self.name)}-{stamp}")
+        written = [base + ".trace.json"]
+        self.export_chrome_trace(written[0])
+        summary = self.summary()
+        if self._profiler:
+            import io
+            import pstats
+            self._profiler.dump_stats(base + ".prof")
+            written.append(base + ".prof")
+            out = io.StringIO()
+            pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(25)
+            summary += "\n\n" + out.getvalue()
+        if self._sampler:
+            with open(base + ".folded", "w") as f:
+                for stack, hits in self._sampler.stacks.most_common():
+                    f.write(f"{stack} {hits}\n")
+            written.append(base + ".folded")
+            summary += "\n\n" + self._sampler.report()
+        with open(base + ".txt", "w") as f:
+            f.write(summary + "\n")
+        written.append(base + ".txt")
+        return written
+
+
+class _Sampler:
+    """Samples the stack of one thread from a background thread."""
+
+    def __init__(self, ident):
+        self.ident = ident
+        self.stacks = Counter()  # "outer;...;inner": samples, the folded format flame graph tools read
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="trace-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.ident)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def report(self, top=20):
+        own = Counter()
+        for stack, hits in self.stacks.items():
+            own[stack.rsplit(";", 1)[-1]] += hits
+        lines = [f"Sampling profile: {self.samples} samples every {SAMPLE_INTERVAL * 1000:.0f} ms"]
+        for func, hits in own.most_common(top):
+            lines.append(f"  {hits / max(self.samples, 1):6.1%}  {func}")
+        return "\n".join(lines)
+
+
+def _safe_name(name):
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
@@ -2,7 +2,6 @@ import os
 import sys
 from pathlib import Path
 import shutil
-import win32com.client
 
 
 def add_to_startup(self):     